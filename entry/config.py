@@ -7,8 +7,10 @@ from typing import List
 import dotenv
 from entry.utils.string_utils import parse_comma_separated_string, build_path
 
-# Load environment variables from .env file if it exists
-dotenv.load_dotenv()
+# Load environment variables from .env file if it exists; skipped on
+# Cloud Run (K_SERVICE) where the orchestrator supplies the environment
+if os.getenv("DOTENV_SKIP") != "1" and not os.getenv("K_SERVICE"):
+    dotenv.load_dotenv()
 
 def parse_bool_env(var_name: str, default: str = "False") -> bool:
     """Parse boolean environment variable with consistent logic"""
@@ -65,6 +67,11 @@ class Settings:
         
         # Container environment detection
         self.is_container = is_container_environment()
+        
+        # Threadpool for sync endpoints and dependencies. Inference already
+        # parallelizes internally, so a small pool avoids oversubscribing
+        # the CPU; raise it if sync handlers mostly wait on I/O.
+        self.threadpool_size = int(os.getenv("THREADPOOL_SIZE", "8"))
 
     def _parse_allowed_origins(self, origins_str):
         """Parse comma-separated string into list of origins"""
@@ -87,7 +94,7 @@ class Settings:
             self.models_dir = models_dir_path
 
 
-@lru_cache()
+@lru_cache(maxsize=1)
 def get_settings():
     """Get cached settings instance"""
     return Settings()
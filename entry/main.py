@@ -5,15 +5,19 @@ import os
 import sys
 import asyncio
 import threading
+import orjson
 import uvicorn
-from typing import Optional, Dict
-from fastapi import FastAPI, Response, status, HTTPException, BackgroundTasks, Request
+import anyio.to_thread
+from contextlib import asynccontextmanager
+from functools import partial
+from dataclasses import dataclass, field
+from typing import Optional
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from loguru import logger
-from dotenv import load_dotenv
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 
-from entry.config import get_settings, is_container_environment, parse_bool_env
+from entry.config import get_settings
 from entry.routers import tts, jobs, voices, streams, debug
 from entry.core.models import (
     initialize_models, 
@@ -21,57 +25,272 @@ from entry.core.models import (
     get_models, 
     get_pipelines
 )
+from entry.services.queue import start_queue_processor
 
-# Global flags to track model loading state
-MODELS_LOADED = False
-initialized = False
-initialization_error = None
+# Settings are fixed for the process lifetime
+_SETTINGS = get_settings()
 
-# Add thread lock for synchronization
+# Pre-serialized probe bodies for the states known before initialization finishes
+_HEALTH_INITIALIZING_BODY = b'{"status":"initializing"}'
+_READY_LOADING_BODY = b'{"status":"loading","message":"Models are still loading"}'
+_READY_OK_BODY = b'{"status":"ready","message":"Models loaded and ready"}'
+
+
+@dataclass(frozen=True)
+class InitState:
+    """Immutable snapshot of model loading state"""
+    # 503 response built once when initialization fails
+    error_response: Optional[ORJSONResponse] = field(default=None, compare=False, repr=False)
+    # Probe responses, serialized once per state transition
+    health_body: bytes = _HEALTH_INITIALIZING_BODY
+    ready_status: int = 503
+    ready_body: bytes = _READY_LOADING_BODY
+
+
+# Serializes model loading in _do_init; never taken on the event loop
 model_init_lock = threading.RLock()
 
-async def check_initialization(request: Request, call_next):
-    """Middleware to check if models are initialized before processing requests"""
-    # Skip initialization check for health check and static files
-    if request.url.path in ["/health", "/favicon.ico"] or request.url.path.startswith("/static/"):
-        return await call_next(request)
+# Paths answered directly by HealthInterceptor, bypassing the FastAPI stack
+# (including CORSMiddleware, so probe responses carry no CORS headers)
+_PROBE_PATHS = frozenset({"/health", "/ready"})
+_JSON_CONTENT_TYPE = (b"content-type", b"application/json")
+_METHOD_NOT_ALLOWED_BODY = b'{"detail":"Method Not Allowed"}'
+
+# Returned by InitGateMiddleware while models are still loading
+_INITIALIZING_RESPONSE = ORJSONResponse(
+    status_code=503,
+    content={
+        "error": "Service not ready",
+        "detail": "Models are still initializing. Please try again in a few moments."
+    }
+)
+
+# Static body for the root endpoint
+_ROOT_RESPONSE = ORJSONResponse({"message": "Kokoro TTS API is running. Visit /docs for API documentation."})
+
+
+def _build_error_response(error: str) -> ORJSONResponse:
+    """Build the 503 response served for every request after initialization fails"""
+    if len(error) > 200:
+        error = error[:197] + "..."
+    return ORJSONResponse(
+        status_code=503,
+        content={"error": "Service not ready", "detail": error}
+    )
+
+
+def _ready_state(health_body: bytes) -> InitState:
+    """Build the snapshot published after models load successfully"""
+    return InitState(
+        health_body=health_body,
+        ready_status=200,
+        ready_body=_READY_OK_BODY
+    )
+
+
+def _error_state(error: str) -> InitState:
+    """Build the snapshot published after initialization fails"""
+    error_body = orjson.dumps({"status": "error", "error": error})
+    return InitState(
+        error_response=_build_error_response(error),
+        health_body=error_body,
+        ready_status=503,
+        ready_body=error_body
+    )
+
+
+class HealthInterceptor:
+    """Pure ASGI wrapper answering /health and /ready before the FastAPI middleware stack;
+    probe bodies come from the wrapped app's state.init_state"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in _PROBE_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "GET":
+            state = self.app.state.init_state
+            if scope["path"] == "/health":
+                status_code, body = 200, state.health_body
+            else:
+                status_code, body = state.ready_status, state.ready_body
+            headers = [_JSON_CONTENT_TYPE]
+        else:
+            status_code, body = 405, _METHOD_NOT_ALLOWED_BODY
+            headers = [_JSON_CONTENT_TYPE, (b"allow", b"GET")]
+        headers.append((b"content-length", str(len(body)).encode()))
+
+        await send({"type": "http.response.start", "status": status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+# Force online mode in containers that don't ship the model files; fixed
+# for the life of the process, so evaluated once at import
+_FORCE_ONLINE = bool(
+    (os.environ.get('CONTAINER_ENV', '').lower() == 'true' or os.environ.get('K_SERVICE', ''))
+    and not os.path.exists(os.path.join(os.getcwd(), 'models', 'Kokoro-82M'))
+)
+
+
+def _do_init(force_online: bool) -> bytes:
+    """Load and validate models and return the serialized healthy /health body;
+    runs on the model-init thread"""
+    try:
+        # Use thread lock for safe initialization
+        with model_init_lock:
+            if force_online:
+                logger.info("Container environment detected, forcing online mode for first run")
+            logger.info("Loading models in background thread")
+            # Force a complete model initialization synchronously within the thread
+            initialize_models(force_online=force_online)
+            
+            # Verify models are properly loaded by checking outputs of core functions
+            models = get_models()
+            pipelines = get_pipelines()
+            voices = get_voices()
+            
+            # Validate critical components are loaded
+            if not models or not pipelines or not voices:
+                raise RuntimeError(f"Critical components missing after initialization: models={bool(models)}, pipelines={bool(pipelines)}, voices={bool(voices)}")
+                
+            logger.info(f"Models loaded successfully: {len(models)} models, {len(pipelines)} pipelines, {len(voices)} voices")
+            return orjson.dumps({"status": "healthy", "voices": list(voices)})
+    except Exception:
+        logger.opt(exception=True).error("Error loading models")
+        raise
+
+
+def _resolve_init_future(fut: asyncio.Future, result: Optional[bytes], error: Optional[BaseException]) -> None:
+    """Complete the init future on the event loop unless it was cancelled at shutdown"""
+    if fut.done():
+        return
+    if error is None:
+        fut.set_result(result)
+    else:
+        fut.set_exception(error)
+
+
+def _run_init(loop: asyncio.AbstractEventLoop, fut: asyncio.Future, force_online: bool) -> None:
+    """Model-init thread target; hands the outcome of _do_init back to the loop"""
+    result, error = None, None
+    try:
+        result = _do_init(force_online)
+    except Exception as e:
+        error = e
+    try:
+        loop.call_soon_threadsafe(_resolve_init_future, fut, result, error)
+    except RuntimeError:
+        # Event loop already closed; the server is shutting down
+        pass
+
+
+def _on_init_done(app: FastAPI, fut: asyncio.Future) -> None:
+    """Publish the initialization outcome; runs on the event loop"""
+    if fut.cancelled():
+        return
+    error = fut.exception()
+    app.state.init_state = _ready_state(fut.result()) if error is None else _error_state(str(error))
+    if error is None:
+        app.state.ready_event.set()
+
+
+# Paths that skip the initialization gate (probes and API docs)
+_BYPASS_PATHS = frozenset({"/health", "/ready", "/docs", "/openapi.json", "/redoc", "/favicon.ico"})
+
+
+class InitGateMiddleware:
+    """Pure ASGI middleware rejecting requests with 503 until models are initialized"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Steady state: models are loaded, pass straight through. Models and
+        # voices were validated once before the ready event was set.
+        if scope["type"] != "http" or scope["app"].state.ready_event.is_set():
+            await self.app(scope, receive, send)
+            return
+
+        # Skip initialization check for probes, docs and static files
+        path = scope["path"]
+        if path in _BYPASS_PATHS or path.startswith("/static/"):
+            await self.app(scope, receive, send)
+            return
+
+        # Serve the prebuilt 503 if initialization failed, otherwise the
+        # still-initializing 503
+        state = scope["app"].state.init_state
+        if state.error_response is not None:
+            await state.error_response(scope, receive, send)
+        else:
+            await _INITIALIZING_RESPONSE(scope, receive, send)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start model initialization on startup and drop its result on shutdown"""
+    settings = _SETTINGS
+    logger.info("Initializing models - startup process beginning")
+    
+    # Size the threadpool used for sync route handlers and dependencies
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.threadpool_size
+    logger.info(f"Threadpool size set to {settings.threadpool_size}")
     
-    # Check if models are loaded
-    models = get_models()
-    voices = get_voices()
+    # Always ensure streams directory exists
+    os.makedirs(os.getenv("STREAMS_DIR", "streams"), exist_ok=True)
     
-    if len(models) == 0 or len(voices) == 0:
-        error_msg = f"Service not ready - models not initialized. Models: {len(models)}, Voices: {len(voices)}"
-        if len(error_msg) > 200:
-            error_msg = error_msg[:197] + "..."
-        
-        logger.error(error_msg)
-        return JSONResponse(
-            status_code=503,
-            content={
-                "error": "Service not ready",
-                "detail": "Models are still initializing. Please try again in a few moments.",
-                "models_loaded": len(models),
-                "voices_loaded": len(voices)
-            }
-        )
+    # Start the queue processor for background job processing
+    start_queue_processor()
+    logger.info("Queue processor started for background job processing")
     
-    logger.info(f"TTS middleware validation passed: models={len(models)}, voices={len(voices)}")
-    return await call_next(request)
+    # Model loading state, replaced wholesale once initialization finishes so
+    # readers see a consistent snapshot from a single attribute load without
+    # locking. The ready event is set on this loop once models are loaded;
+    # endpoints that must block until then can await app.state.ready_event.wait()
+    app.state.init_state = InitState()
+    app.state.ready_event = asyncio.Event()
+    
+    # For Cloud Run, we need to make initialization non-blocking
+    # to allow the health check endpoint to respond quickly. A daemon thread
+    # is used so an in-progress download or model load never holds up process
+    # exit on SIGTERM, Ctrl+C or a --reload restart.
+    loop = asyncio.get_running_loop()
+    app.state.init_future = loop.create_future()
+    app.state.init_future.add_done_callback(partial(_on_init_done, app))
+    threading.Thread(
+        target=_run_init,
+        args=(loop, app.state.init_future, _FORCE_ONLINE),
+        name="model-init",
+        daemon=True
+    ).start()
+    
+    try:
+        yield
+    finally:
+        app.state.init_future.cancel()
+
 
 def create_app() -> FastAPI:
     """Create and configure FastAPI application"""
-    load_dotenv()
-    settings = get_settings()
+    settings = _SETTINGS
     
     app = FastAPI(
         title="Kokoro TTS API",
         description="REST API for Kokoro Text-to-Speech Engine",
         version="1.0.0",
         docs_url="/docs" if not settings.is_container else None,
-        redoc_url="/redoc" if not settings.is_container else None
+        redoc_url="/redoc" if not settings.is_container else None,
+        default_response_class=ORJSONResponse,
+        lifespan=lifespan
     )
 
+    # Initial model loading state; the lifespan resets both on every startup
+    app.state.init_state = InitState()
+    app.state.ready_event = asyncio.Event()
+
     # Add CORS middleware
     app.add_middleware(
         CORSMiddleware,
@@ -82,86 +301,21 @@ def create_app() -> FastAPI:
     )
 
     # Add initialization check middleware
-    app.middleware("http")(check_initialization)
-
-    # Initialize models on startup
-    @app.on_event("startup")
-    async def startup_event():
-        """Initialize models on startup"""
-        global MODELS_LOADED, initialized, initialization_error
-        
-        logger.info("Initializing models - startup process beginning")
-        
-        # Start the queue processor for background job processing
-        from entry.services.queue import start_queue_processor
-        start_queue_processor()
-        logger.info("Queue processor started for background job processing")
-        
-        # For Cloud Run, we need to make initialization non-blocking
-        # to allow the health check endpoint to respond quickly
-        def init_models_thread():
-            global MODELS_LOADED, initialized, initialization_error
-            try:
-                # Use thread lock for safe initialization
-                with model_init_lock:
-                    # Determine if we need to force online mode for container initialization
-                    force_online = False
-                    if os.environ.get('CONTAINER_ENV', '').lower() == 'true' or \
-                       os.environ.get('K_SERVICE', '').lower() != '':
-                        force_online = not os.path.exists(os.path.join(os.getcwd(), 'models', 'Kokoro-82M'))
-                        if force_online:
-                            logger.info("Container environment detected, forcing online mode for first run")
-                    
-                    logger.info("Loading models in background thread")
-                    # Force a complete model initialization synchronously within the thread
-                    initialize_models(force_online=force_online)
-                    
-                    # Verify models are properly loaded by checking outputs of core functions
-                    models = get_models()
-                    pipelines = get_pipelines()
-                    voices = get_voices()
-                    
-                    # Validate critical components are loaded
-                    if not models or not pipelines or not voices:
-                        raise RuntimeError(f"Critical components missing after initialization: models={bool(models)}, pipelines={bool(pipelines)}, voices={bool(voices)}")
-                        
-                    logger.info(f"Models loaded successfully: {len(models)} models, {len(pipelines)} pipelines, {len(voices)} voices")
-                    MODELS_LOADED = True
-                    initialized = True  # Set initialized flag when models are loaded
-                    initialization_error = None  # Clear any previous errors
-            except Exception as e:
-                logger.error(f"Error loading models: {e}")
-                import traceback
-                logger.error(f"Initialization error traceback: {traceback.format_exc()}")
-                initialization_error = str(e)  # Set error message
-                MODELS_LOADED = False
-                initialized = False
-        
-        # Start initialization in a background thread
-        thread = threading.Thread(target=init_models_thread)
-        thread.daemon = True
-        thread.start()
-
-    # Health check endpoints for Cloud Run
+    app.add_middleware(InitGateMiddleware)
+
+    # Health check endpoints for Cloud Run. Requests to the exported app are
+    # answered by HealthInterceptor; these routes only document the probes in
+    # the OpenAPI schema and serve them when fastapi_app is mounted directly.
     @app.get("/health", tags=["Health"])
     async def health_check():
         """Basic health check that always returns 200 OK (for initial container startup)"""
-        if initialization_error:
-            return {"status": "error", "error": initialization_error}
-        if not initialized:
-            return {"status": "initializing"}
-        return {"status": "healthy", "voices": list(get_voices())}
+        return Response(content=app.state.init_state.health_body, media_type="application/json")
     
     @app.get("/ready", tags=["Health"])
-    async def readiness_check(response: Response):
+    async def readiness_check():
         """Readiness check that returns 200 only when models are fully loaded"""
-        if initialization_error:
-            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
-            return {"status": "error", "error": initialization_error}
-        if not initialized:
-            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
-            return {"status": "loading", "message": "Models are still loading"}
-        return {"status": "ready", "message": "Models loaded and ready"}
+        state = app.state.init_state
+        return Response(content=state.ready_body, status_code=state.ready_status, media_type="application/json")
     
     # Include routers
     app.include_router(tts.router, prefix="/tts", tags=["TTS"])
@@ -172,17 +326,14 @@ def create_app() -> FastAPI:
 
     @app.get("/")
     async def root():
-        return {"message": "Kokoro TTS API is running. Visit /docs for API documentation."}
+        return _ROOT_RESPONSE
 
     return app
 
 
-# Create the application instance
-app = create_app()
-
-# Always ensure streams directory exists
-streams_dir = os.getenv("STREAMS_DIR", "streams")
-os.makedirs(streams_dir, exist_ok=True)
+# Create the application instance; probes are served by the ASGI wrapper
+fastapi_app = create_app()
+app = HealthInterceptor(fastapi_app)
 
 # Only used when running this file directly (development mode)
 if __name__ == "__main__":
@@ -190,6 +341,19 @@ if __name__ == "__main__":
     port = int(os.getenv("PORT", 8080))
     host = os.getenv("HOST", "0.0.0.0")
     reload_mode = os.getenv("RELOAD", "False").lower() in ("true", "1", "t")
+    workers = int(os.getenv("WORKERS", "1"))
     
-    print(f"Starting development server at {host}:{port} (reload={reload_mode})")
-    uvicorn.run("entry.main:app", host=host, port=port, reload=reload_mode)
\ No newline at end of file
+    # Pin uvloop/httptools so uvicorn never falls back to asyncio + h11;
+    # uvloop is not installed on Windows, so let uvicorn pick the loop there.
+    # In production run one worker per CPU under the orchestrator instead, e.g.
+    # gunicorn entry.main:app -k uvicorn.workers.UvicornWorker -w N
+    print(f"Starting development server at {host}:{port} (reload={reload_mode}, workers={workers})")
+    uvicorn.run(
+        "entry.main:app",
+        host=host,
+        port=port,
+        reload=reload_mode,
+        loop="uvloop" if sys.platform != "win32" else "auto",
+        http="httptools",
+        workers=workers
+    )
\ No newline at end of file